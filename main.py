@@ -1,16 +1,116 @@
+from contextlib import asynccontextmanager
+from typing import Annotated
+from urllib.parse import parse_qs
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, field_validator
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, BeforeValidator, ConfigDict
 from youtube_transcript_api._api import YouTubeTranscriptApi
+from youtube_transcript_api._errors import (
+    AgeRestricted,
+    NoTranscriptFound,
+    TranscriptsDisabled,
+    VideoUnavailable,
+    VideoUnplayable,
+)
+from cachetools import TTLCache
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import anyio.to_thread
+import orjson
+import zstandard as zstd
 import uvicorn
-import re
+import asyncio
+import os
+import socket
+import string
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Characters allowed in a YouTube video ID
+_ALLOWED = frozenset(string.ascii_letters + string.digits + '_-')
+
+# Longest input worth scanning for a video ID
+_MAX_VIDEO_ID_INPUT = 2048
+# Transcripts compress well, so cached captions are stored zstd-compressed
+_ZC = zstd.ZstdCompressor(level=3)
+_ZD = zstd.ZstdDecompressor()
+_COMPRESS_MIN_BYTES = 1024
+
+# In-process caption cache, keyed by video ID and bounded by stored caption bytes,
+# so compressing entries lets more of them fit
+_CAP_CACHE_BYTES = 64 * 1024 * 1024
+# Rough cost of the key, tuple and language string, so small or empty entries still count
+_CACHE_ENTRY_OVERHEAD = 256
+_cap_cache: TTLCache = TTLCache(
+    maxsize=_CAP_CACHE_BYTES,
+    ttl=3600,
+    getsizeof=lambda entry: len(entry[0]) + _CACHE_ENTRY_OVERHEAD
+)
+# Per-video fetch lock and the number of requests currently holding or awaiting it
+_cap_locks: dict[str, tuple[asyncio.Lock, list[int]]] = {}
+# Short-lived cache of client errors (e.g. NO_TRANSCRIPT_AVAILABLE) so retries don't hit YouTube
+_neg_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+_cache_hits = 0
+_cache_misses = 0
+
+# (connect, read) timeout for YouTube calls; the transcript client sets none itself
+_YT_TIMEOUT = (3.05, 10)
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies _YT_TIMEOUT to requests sent without a timeout"""
+
+    def send(self, request, **kwargs):
+        # Session.request always passes timeout, as None when unset
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = _YT_TIMEOUT
+        return super().send(request, **kwargs)
+
+# Shared, connection-pooled HTTP session for all YouTube requests
+_SESSION = Session()
+_SESSION.mount(
+    'https://',
+    _TimeoutHTTPAdapter(
+        pool_connections=20,
+        pool_maxsize=50,
+        max_retries=Retry(total=2, backoff_factor=0.1),
+    ),
+)
+_YT_API = YouTubeTranscriptApi(http_client=_SESSION)
+
+# Worker threads available for blocking YouTube calls
+_THREAD_LIMIT = 200
+
+# Cap on concurrent transcript fetches so bursts don't trip YouTube rate limits.
+# Applies per worker process, as do the thread limit and caches above.
+_YT_SEM = asyncio.Semaphore(int(os.environ.get("YT_CONCURRENCY", 32)))
+
+def _warm_up():
+    """Resolve YouTube and open a pooled connection before the first request"""
+    try:
+        socket.getaddrinfo("www.youtube.com", 443)
+        # HEAD opens the TLS connection without downloading the homepage
+        _SESSION.head("https://www.youtube.com", allow_redirects=False, timeout=2)
+    except Exception as e:
+        logger.warning("YouTube warm-up failed: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Allow many transcript fetches to be in flight at once
+    anyio.to_thread.current_default_thread_limiter().total_tokens = _THREAD_LIMIT
+    # Warm up in the background so a slow network doesn't delay accepting requests;
+    # the local reference keeps the task alive while the app runs
+    warm_up_task = asyncio.create_task(run_in_threadpool(_warm_up))
+    yield
+
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     title="YouTube Caption Extractor API",
     description="FastAPI service for extracting YouTube video captions for Zapier integration",
     version="1.0.0"
@@ -25,164 +125,243 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class VideoRequest(BaseModel):
-    video_id: str
-
-    @field_validator('video_id')
-    @classmethod
-    def validate_video_id(cls, v):
-        # Clean the video_id if it's a full YouTube URL
-        if 'youtube.com/watch?v=' in v:
-            match = re.search(r'v=([a-zA-Z0-9_-]+)', v)
-            if match:
-                v = match.group(1)
-        elif 'youtu.be/' in v:
-            match = re.search(r'youtu\.be/([a-zA-Z0-9_-]+)', v)
-            if match:
-                v = match.group(1)
-
-        # Validate YouTube video ID format
-        if not re.match(r'^[a-zA-Z0-9_-]{11}$', v):
-            raise ValueError('Invalid YouTube video ID format')
+def _is_bare_id(v: str) -> bool:
+    """Check whether a string is already a bare 11-char video ID"""
+    return len(v) == 11 and _ALLOWED.issuperset(v)
 
+def _clean_video_id(v):
+    """Reduce a YouTube URL or bare ID to the 11-char video ID"""
+    # Reject non-strings here: pydantic would otherwise coerce bytes to str
+    # after this validator, skipping the ID checks below
+    if not isinstance(v, str):
+        raise ValueError('Invalid YouTube video ID format')
+    # Bare IDs are by far the most common input, so accept them before any parsing
+    if _is_bare_id(v):
         return v
+    if len(v) > _MAX_VIDEO_ID_INPUT:
+        raise ValueError('Invalid YouTube video ID format')
+
+    # Clean the video_id if it's a full YouTube URL
+    video_id = None
+    if (idx := v.find('youtube.com/watch?')) >= 0:
+        query = v[idx + 18:].partition('#')[0]
+        video_id = parse_qs(query).get('v', [None])[0]
+    elif (idx := v.find('youtu.be/')) >= 0:
+        video_id = v[idx + 9:idx + 20]
+        # The ID must not run on past 11 characters
+        if v[idx + 20:idx + 21] not in ('', '?', '&', '#', '/'):
+            video_id = None
+
+    if video_id is None or not _is_bare_id(video_id):
+        raise ValueError('Invalid YouTube video ID format')
+
+    return video_id
+
+class VideoRequest(BaseModel):
+    video_id: Annotated[str, BeforeValidator(_clean_video_id)]
 
 class CaptionResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     video_id: str
     captions: str
     language: str = "en"
     total_duration: float = 0.0
 
 class ErrorResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     error: str
     error_code: str
     video_id: str | None = None
 
+# Health check bodies never change, so serialize them once
+_HEALTH_CHECK_BODY = orjson.dumps({
+    "status": "healthy",
+    "service": "YouTube Caption Extractor",
+    "version": "1.0.0",
+    "endpoints": {
+        "get_captions": "/get-captions",
+        "health": "/",
+        "docs": "/docs"
+    }
+})
+_HEALTH_BODY = orjson.dumps({"status": "ok", "service": "youtube-caption-extractor"})
+
 @app.get("/", summary="Health Check")
 async def health_check():
     """Health check endpoint for monitoring and Zapier verification"""
-    return {
-        "status": "healthy",
-        "service": "YouTube Caption Extractor",
-        "version": "1.0.0",
-        "endpoints": {
-            "get_captions": "/get-captions",
-            "health": "/",
-            "docs": "/docs"
-        }
-    }
+    return Response(content=_HEALTH_CHECK_BODY, media_type="application/json")
 
 @app.get("/health", summary="Alternative Health Check")
 async def health():
     """Alternative health check endpoint"""
-    return {"status": "ok", "service": "youtube-caption-extractor"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
-@app.post("/get-captions", 
-          response_model=CaptionResponse,
-          summary="Extract YouTube Video Captions",
-          description="Extract captions/transcripts from a YouTube video by video ID")
-async def get_captions(req: VideoRequest):
-    """
-    Extract captions from a YouTube video.
+def _caption_error(status_code: int, error_code: str, message: str, video_id: str) -> HTTPException:
+    """Build an HTTPException carrying the ErrorResponse payload"""
+    return HTTPException(
+        status_code=status_code,
+        detail={
+            "error": message,
+            "error_code": error_code,
+            "video_id": video_id
+        }
+    )
 
-    - **video_id**: YouTube video ID (11 characters) or full YouTube URL
+async def _fetch_captions(video_id: str) -> dict:
+    """Fetch a transcript from YouTube and join it into a single caption string"""
+    logger.info("Processing request for video ID: %s", video_id)
 
-    Returns the concatenated transcript text with metadata.
-    """
     try:
-        logger.info(f"Processing request for video ID: {req.video_id}")
-
-        # Use the new API structure
-        try:
-            # Create API instance
-            api = YouTubeTranscriptApi()
-
-            # Try to fetch transcript directly (this will get the best available)
-            fetched_transcript = api.fetch(req.video_id)
-
-            # Extract data from the FetchedTranscript object
-            transcript = []
-            for snippet in fetched_transcript.snippets:
-                transcript.append({
-                    "text": snippet.text,
-                    "start": snippet.start,
-                    "duration": snippet.duration
-                })
-
-            language = fetched_transcript.language_code
-            logger.info(f"Successfully fetched transcript in language: {language}")
-
-        except Exception as e:
-            logger.error(f"No transcripts available for video {req.video_id}: {str(e)}")
-            raise HTTPException(
-                status_code=404,
-                detail={
-                    "error": "No captions/transcripts available for this video",
-                    "error_code": "NO_TRANSCRIPT_AVAILABLE",
-                    "video_id": req.video_id
-                }
-            )
-
-        # Extract text and calculate total duration
-        text_segments = []
+        # Try to fetch transcript directly (this will get the best available)
+        # The client is blocking, so run it off the event loop
+        async with _YT_SEM:
+            fetched_transcript = await run_in_threadpool(_YT_API.fetch, video_id)
+    except VideoUnavailable as e:
+        logger.error("Video %s is unavailable: %s", video_id, e)
+        raise _caption_error(404, "VIDEO_NOT_FOUND", "Video not found or is unavailable", video_id)
+    except TranscriptsDisabled as e:
+        logger.error("Captions are disabled for video %s: %s", video_id, e)
+        raise _caption_error(400, "CAPTIONS_DISABLED", "Captions are disabled for this video", video_id)
+    except AgeRestricted as e:
+        logger.error("Video %s is age restricted: %s", video_id, e)
+        raise _caption_error(
+            403, "VIDEO_AGE_RESTRICTED", "Video is age restricted and captions cannot be accessed", video_id
+        )
+    except VideoUnplayable as e:
+        # Raised for private, region-blocked and not-yet-live videos, among others
+        logger.error("Video %s is unplayable: %s", video_id, e)
+        message = f"Video is unplayable: {e.reason}" if e.reason else "Video is unplayable"
+        raise _caption_error(403, "VIDEO_UNPLAYABLE", message, video_id)
+    except NoTranscriptFound as e:
+        logger.error("No transcripts available for video %s: %s", video_id, e)
+        raise _caption_error(
+            404, "NO_TRANSCRIPT_AVAILABLE", "No captions/transcripts available for this video", video_id
+        )
+    except Exception as e:
+        logger.error("Error processing video %s: %s", video_id, e)
+        raise _caption_error(500, "PROCESSING_ERROR", f"Error processing video: {str(e)}", video_id)
+
+    # Read snippets straight off the FetchedTranscript object
+    snippets = fetched_transcript.snippets
+
+    language = fetched_transcript.language_code
+    logger.info("Successfully fetched transcript in language: %s", language)
+
+    # Join all text segments, collapsing whitespace runs and newlines
+    captions_text = " ".join(
+        word for snippet in snippets for word in snippet.text.split()
+    )
+
+    # Snippets come back in start order, so the last one ends the video
+    if snippets:
+        total_duration = snippets[-1].start + snippets[-1].duration
+    else:
         total_duration = 0.0
 
-        for segment in transcript:
-            text_segments.append(segment["text"])
-            # Calculate total duration from the last segment
-            if "start" in segment and "duration" in segment:
-                segment_end = segment["start"] + segment["duration"]
-                if segment_end > total_duration:
-                    total_duration = segment_end
+    logger.info("Successfully extracted captions for video %s, length: %d characters", video_id, len(captions_text))
 
-        # Join all text segments
-        captions_text = " ".join(text_segments)
+    return {
+        "video_id": video_id,
+        "captions": captions_text,
+        "language": language,
+        "total_duration": total_duration
+    }
 
-        # Clean up the text (remove excessive whitespace, newlines)
-        captions_text = re.sub(r'\s+', ' ', captions_text).strip()
+def _pack_captions(payload: dict) -> tuple:
+    """Convert a caption payload into a compact cache entry"""
+    captions = payload["captions"].encode("utf-8")
+    if len(captions) >= _COMPRESS_MIN_BYTES:
+        captions = _ZC.compress(captions)
+        compressed = True
+    else:
+        compressed = False
+    return captions, compressed, payload["language"], payload["total_duration"]
 
-        logger.info(f"Successfully extracted captions for video {req.video_id}, length: {len(captions_text)} characters")
+def _unpack_captions(video_id: str, entry: tuple) -> dict:
+    """Rebuild a caption payload from a cache entry"""
+    captions, compressed, language, total_duration = entry
+    if compressed:
+        captions = _ZD.decompress(captions)
+    return {
+        "video_id": video_id,
+        "captions": captions.decode("utf-8"),
+        "language": language,
+        "total_duration": total_duration
+    }
 
-        return CaptionResponse(
-            video_id=req.video_id,
-            captions=captions_text,
-            language=language,
-            total_duration=total_duration
-        )
+def _lookup_cached(video_id: str) -> dict | None:
+    """Return a cached payload, re-raise a cached error, or return None on a miss"""
+    global _cache_hits
 
-    except HTTPException:
-        # Re-raise HTTP exceptions as they are already properly formatted
-        raise
-    except Exception as e:
-        logger.error(f"Error processing video {req.video_id}: {str(e)}")
-
-        # Determine specific error type
-        error_message = str(e).lower()
-        if "video unavailable" in error_message or "video does not exist" in error_message:
-            error_code = "VIDEO_NOT_FOUND"
-            user_message = "Video not found or is unavailable"
-            status_code = 404
-        elif "private" in error_message:
-            error_code = "VIDEO_PRIVATE"
-            user_message = "Video is private and captions cannot be accessed"
-            status_code = 403
-        elif "disabled" in error_message:
-            error_code = "CAPTIONS_DISABLED"
-            user_message = "Captions are disabled for this video"
-            status_code = 400
-        else:
-            error_code = "PROCESSING_ERROR"
-            user_message = f"Error processing video: {str(e)}"
-            status_code = 500
-
-        raise HTTPException(
-            status_code=status_code,
-            detail={
-                "error": user_message,
-                "error_code": error_code,
-                "video_id": req.video_id
-            }
-        )
+    error = _neg_cache.get(video_id)
+    if error is not None:
+        _cache_hits += 1
+        logger.info("Cached error for video %s (hits: %d, misses: %d)", video_id, _cache_hits, _cache_misses)
+        status_code, detail = error
+        raise HTTPException(status_code=status_code, detail=detail)
+
+    entry = _cap_cache.get(video_id)
+    if entry is None:
+        return None
+
+    _cache_hits += 1
+    logger.info("Caption cache hit for video %s (hits: %d, misses: %d)", video_id, _cache_hits, _cache_misses)
+    return _unpack_captions(video_id, entry)
+
+async def _cached_captions(video_id: str) -> dict:
+    """Return captions for a video, serving repeat requests from the in-process cache"""
+    global _cache_misses
+
+    cached = _lookup_cached(video_id)
+    if cached is not None:
+        return cached
+
+    # One fetch per video ID at a time; concurrent requests wait for the first
+    entry = _cap_locks.get(video_id)
+    if entry is None:
+        entry = _cap_locks[video_id] = (asyncio.Lock(), [0])
+    lock, users = entry
+    users[0] += 1
+    try:
+        async with lock:
+            cached = _lookup_cached(video_id)
+            if cached is not None:
+                return cached
+
+            _cache_misses += 1
+            logger.info("Caption cache miss for video %s (hits: %d, misses: %d)", video_id, _cache_hits, _cache_misses)
+            try:
+                response = await _fetch_captions(video_id)
+            except HTTPException as e:
+                # Client errors won't change on an immediate retry; server errors might
+                if e.status_code < 500:
+                    _neg_cache[video_id] = (e.status_code, e.detail)
+                raise
+            _cap_cache[video_id] = _pack_captions(response)
+            return response
+    finally:
+        # Only drop the lock once no queued request still needs it
+        users[0] -= 1
+        if users[0] == 0:
+            del _cap_locks[video_id]
+
+# Responses are returned directly to skip re-validating the payload;
+# the model is still declared for the OpenAPI schema
+@app.post("/get-captions",
+          responses={200: {"model": CaptionResponse}},
+          summary="Extract YouTube Video Captions",
+          description="Extract captions/transcripts from a YouTube video by video ID")
+async def get_captions(req: VideoRequest):
+    """
+    Extract captions from a YouTube video.
+
+    - **video_id**: YouTube video ID (11 characters) or full YouTube URL
+
+    Returns the concatenated transcript text with metadata.
+    """
+    return ORJSONResponse(await _cached_captions(req.video_id))
 
 @app.get("/video/{video_id}/captions", summary="Get Captions by URL Parameter")
 async def get_captions_by_url(video_id: str):
@@ -190,15 +369,23 @@ async def get_captions_by_url(video_id: str):
     Alternative endpoint to get captions using URL parameter instead of POST body.
     Useful for simple GET requests from Zapier or other automation tools.
     """
+    # Bare IDs are already valid; only URLs need the full validator
+    if _is_bare_id(video_id):
+        return ORJSONResponse(await _cached_captions(video_id))
+
     request = VideoRequest(video_id=video_id)
     return await get_captions(request)
 
 if __name__ == "__main__":
-    import os
-    port = int(os.environ.get("PORT", 8000)) 
+    port = int(os.environ.get("PORT", 8000))
     uvicorn.run(
-        app, 
-        host="0.0.0.0", 
+        "main:app",
+        host="0.0.0.0",
         port=port,
-        log_level="info"
+        loop="uvloop",
+        http="httptools",
+        # Same bounded default as the Dockerfile; os.cpu_count() ignores container CPU quotas
+        workers=int(os.environ.get("WEB_CONCURRENCY", 2)),
+        log_level="info",
+        access_log=False
     )